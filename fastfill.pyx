@@ -0,0 +1,67 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Генерация батча случайных строк сразу в бинарном формате COPY.
+
+Весь конвейер "случайные байты -> записи COPY" выполняется одним
+C-циклом без промежуточных Python-объектов; результат возвращается
+готовым bytes для cursor.copy_expert. Собирается через
+`python setup.py build_ext --inplace`; при отсутствии модуля
+fill_data.py использует Numba-ядро.
+"""
+
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+
+cdef extern from "stdlib.h" nogil:
+    int rand_r(unsigned int *seedp)
+
+# Заголовок бинарного формата COPY: сигнатура + флаги + длина расширения
+cdef const unsigned char *HEADER = b"PGCOPY\n\xff\r\n\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def fill_copy_batch(int n, int min_length, int max_length, unsigned int seed, bytes alphabet):
+    """Возвращает payload бинарного COPY с n случайными строками.
+
+    Каждая запись - число полей (int16) + длина значения (int32) +
+    байты значения из переданного алфавита; заголовок PGCOPY и
+    завершитель уже включены в результат.
+    """
+    cdef int alpha_len = len(alphabet)
+    cdef const unsigned char *alpha = <const unsigned char *> PyBytes_AS_STRING(alphabet)
+    cdef int span = max_length - min_length + 1
+    cdef Py_ssize_t cap = 19 + <Py_ssize_t> n * (max_length + 6) + 2
+
+    cdef unsigned char *buf = <unsigned char *> malloc(cap)
+    if buf == NULL:
+        raise MemoryError()
+
+    cdef Py_ssize_t pos = 19
+    cdef unsigned int state = seed
+    cdef int i, j, length
+
+    try:
+        memcpy(buf, HEADER, 19)
+
+        for i in range(n):
+            length = min_length + rand_r(&state) % span
+            # Число полей в записи (всегда 1), big-endian int16
+            buf[pos] = 0
+            buf[pos + 1] = 1
+            # Длина поля value, big-endian int32
+            buf[pos + 2] = (length >> 24) & 0xFF
+            buf[pos + 3] = (length >> 16) & 0xFF
+            buf[pos + 4] = (length >> 8) & 0xFF
+            buf[pos + 5] = length & 0xFF
+            pos += 6
+            for j in range(length):
+                buf[pos] = alpha[rand_r(&state) % alpha_len]
+                pos += 1
+
+        buf[pos] = 0xFF
+        buf[pos + 1] = 0xFF
+        pos += 2
+
+        return PyBytes_FromStringAndSize(<char *> buf, pos)
+    finally:
+        free(buf)
@@ -7,12 +7,27 @@ import psycopg2
 import random
 import string
 import time
-from psycopg2.extras import execute_batch
+import io
+import numpy as np
+from psycopg2.extras import execute_values
 import os
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import fastfill
+    FASTFILL_AVAILABLE = True
+except ImportError:
+    FASTFILL_AVAILABLE = False
 
 load_dotenv()
 
@@ -31,11 +46,129 @@ RECORDS_COUNT = 2_000_000
 # Размер батча для вставки
 BATCH_SIZE = 10000
 
+# Алфавит для генерации строк: печатные ASCII-символы без обратного слэша,
+# чтобы значения не требовали экранирования в формате COPY text
+ALPHABET = (string.ascii_letters + string.digits + string.punctuation + ' ').replace('\\', '')
+ALPHABET_BYTES = np.frombuffer(ALPHABET.encode('ascii'), dtype=np.uint8)
+
+# Заголовок и завершитель бинарного формата COPY
+# (сигнатура + 4 байта флагов + 4 байта длины расширения заголовка)
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8
+COPY_BINARY_TRAILER = b'\xff\xff'
+
+
+# Локальный экземпляр Random с привязанными методами:
+# без поиска атрибутов модуля random на каждом вызове
+_R = random.Random()
+_randint = _R.randint
+_choices = _R.choices
+
 
 def generate_random_string(min_length, max_length):
     """Генерирует случайную строку заданной длины."""
-    length = random.randint(min_length, max_length)
-    return ''.join(random.choices(string.ascii_letters + string.digits + string.punctuation + ' ', k=length))
+    length = _randint(min_length, max_length)
+    return ''.join(_choices(ALPHABET, k=length))
+
+
+# Размер пула заранее сгенерированных строк для заполнения без Numba
+POOL_SIZE = 4096
+
+_string_pools = {}
+
+_rng = np.random.default_rng()
+
+
+def _get_string_pool(min_length, max_length):
+    """Возвращает (кэшируя) пул случайных строк для заданного диапазона длин."""
+    key = (min_length, max_length)
+    pool = _string_pools.get(key)
+    if pool is None:
+        # Все длины и индексы символов берутся двумя векторными вызовами NumPy
+        # вместо отдельных random.randint/random.choices на каждую строку
+        lens = _rng.integers(min_length, max_length + 1, size=POOL_SIZE)
+        idxs = _rng.integers(0, ALPHABET_BYTES.size, size=int(lens.sum()))
+        chars = ALPHABET_BYTES[idxs].tobytes().decode('ascii')
+
+        pool = []
+        start = 0
+        for length in lens:
+            pool.append(chars[start:start + length])
+            start += length
+        _string_pools[key] = pool
+    return pool
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _seed_kernel(seed):
+        """Инициализирует генератор случайных чисел внутри Numba-ядер."""
+        np.random.seed(seed)
+
+    @njit(cache=True)
+    def _fill_batch(out, ends, alphabet, min_length, max_length, n):
+        """Заполняет буфер out байтами n случайных строк.
+
+        В ends[i] записывается позиция конца i-й строки в буфере.
+        Возвращает общее число записанных байт.
+        """
+        pos = 0
+        for i in range(n):
+            length = np.random.randint(min_length, max_length + 1)
+            for _ in range(length):
+                out[pos] = alphabet[np.random.randint(0, alphabet.size)]
+                pos += 1
+            ends[i] = pos
+        return pos
+
+    @njit(cache=True)
+    def _fill_copy_arena(arena, alphabet, min_length, max_length, n):
+        """Пишет n случайных строк прямо в арену в бинарном формате COPY.
+
+        Каждая запись кодируется как число полей (int16 big-endian),
+        длина поля (int32 big-endian) и сами байты значения; экранирование
+        не требуется. Заголовок и завершитель дописываются снаружи.
+        Возвращает число записанных байт.
+        """
+        pos = 0
+        for _ in range(n):
+            length = np.random.randint(min_length, max_length + 1)
+            # Число полей в записи (всегда 1)
+            arena[pos] = 0
+            arena[pos + 1] = 1
+            # Длина поля value
+            arena[pos + 2] = (length >> 24) & 0xFF
+            arena[pos + 3] = (length >> 16) & 0xFF
+            arena[pos + 4] = (length >> 8) & 0xFF
+            arena[pos + 5] = length & 0xFF
+            pos += 6
+            for _ in range(length):
+                arena[pos] = alphabet[np.random.randint(0, alphabet.size)]
+                pos += 1
+        return pos
+
+
+def generate_batch(batch_count, min_length, max_length):
+    """Генерирует список случайных строк для одного батча.
+
+    При наличии Numba строки генерируются скомпилированным ядром,
+    заполняющим один общий байтовый буфер; иначе - построчно на Python.
+    """
+    if not NUMBA_AVAILABLE:
+        # Выбор из готового пула - O(1) на строку вместо O(length);
+        # повторы значений для этих тестов роли не играют
+        pool = _get_string_pool(min_length, max_length)
+        return [pool[i] for i in _rng.integers(0, POOL_SIZE, size=batch_count)]
+
+    out = np.empty(batch_count * max_length, dtype=np.uint8)
+    ends = np.empty(batch_count, dtype=np.int64)
+    _fill_batch(out, ends, ALPHABET_BYTES, min_length, max_length, batch_count)
+
+    batch = []
+    start = 0
+    for end in ends:
+        batch.append(bytes(out[start:end]).decode('ascii'))
+        start = end
+    return batch
 
 
 def create_tables(conn, logger):
@@ -44,13 +177,12 @@ def create_tables(conn, logger):
     
     logger.info("Создание таблиц...")
     
-    # Таблица 1: varchar, индекс на value, значения 1-100 символов
+    # Таблица 1: varchar, индекс на value (строится после загрузки), значения 1-100 символов
     cur.execute("""
         CREATE TABLE IF NOT EXISTS table1 (
             id SERIAL PRIMARY KEY,
             value VARCHAR
         );
-        CREATE INDEX IF NOT EXISTS idx_table1_value ON table1(value);
     """)
     
     # Таблица 2: varchar, без индекса, значения 1-100 символов
@@ -77,13 +209,12 @@ def create_tables(conn, logger):
         );
     """)
     
-    # Таблица 5: varchar(1000) с индексом, значения 500-1000 символов
+    # Таблица 5: varchar(1000) с индексом (строится после загрузки), значения 500-1000 символов
     cur.execute("""
         CREATE TABLE IF NOT EXISTS table5 (
             id SERIAL PRIMARY KEY,
             value VARCHAR(1000)
         );
-        CREATE INDEX IF NOT EXISTS idx_table5_value ON table5(value);
     """)
     
     # Таблица 6: text без индекса, значения 9000-10000 символов
@@ -107,11 +238,46 @@ def create_tables(conn, logger):
     logger.info("Таблицы созданы успешно.\n")
 
 
+# Индексы по value: дешевле построить один раз после загрузки,
+# чем поддерживать btree на каждой из 2M вставок
+TABLE_INDEXES = {
+    'table1': 'idx_table1_value',
+    'table5': 'idx_table5_value',
+}
+
+
+def build_indexes(conn, logger):
+    """Строит индексы по value после загрузки данных."""
+    cur = conn.cursor()
+    logger.info("Построение индексов...")
+
+    # Больше памяти на сортировку при построении индекса
+    cur.execute("SET maintenance_work_mem = '2GB'")
+
+    for table_name, index_name in TABLE_INDEXES.items():
+        start_time = time.time()
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}(value)")
+        conn.commit()
+        logger.info(f"  {index_name} построен за {time.time() - start_time:.2f} сек")
+
+    cur.close()
+    logger.info("Индексы построены успешно.\n")
+
+
 def get_table_count(conn, table_name):
-    """Получает количество записей в таблице."""
+    """Получает количество записей в таблице (оценка планировщика)."""
     cur = conn.cursor()
-    cur.execute(f"SELECT COUNT(*) FROM {table_name}")
-    count = cur.fetchone()[0]
+
+    # reltuples из pg_class - O(1) вместо полного скана COUNT(*).
+    # Если оценки еще нет (-1) или она нулевая (таблица могла не пройти
+    # ANALYZE после загрузки) - перепроверяем честным COUNT
+    cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", (table_name,))
+    row = cur.fetchone()
+    count = row[0] if row else -1
+    if count <= 0:
+        cur.execute(f"SELECT COUNT(*) FROM {table_name}")
+        count = cur.fetchone()[0]
+
     cur.close()
     return count
 
@@ -136,9 +302,19 @@ def fill_table(conn, table_name, min_length, max_length, batch_size=BATCH_SIZE,
     logger.info(f"  Количество записей: {RECORDS_COUNT:,}")
     logger.info(f"  Размер батча: {batch_size:,}")
     
+    # Отключаем синхронный коммит на время загрузки:
+    # массовая вставка не ждет fsync WAL на каждый коммит
+    cur.execute("SET synchronous_commit = OFF")
+
+    # Если индекс уже есть (например, от старого запуска) - убираем на время загрузки
+    index_name = TABLE_INDEXES.get(table_name)
+    if index_name:
+        cur.execute(f"DROP INDEX IF EXISTS {index_name}")
+        conn.commit()
+
     start_time = time.time()
     total_inserted = 0
-    
+
     # Проверяем текущее количество записей
     current_count = get_table_count(conn, table_name)
     if current_count > 0:
@@ -150,21 +326,72 @@ def fill_table(conn, table_name, min_length, max_length, batch_size=BATCH_SIZE,
         cur.execute(f"TRUNCATE TABLE {table_name} RESTART IDENTITY")
         conn.commit()
     
+    # COPY FROM STDIN быстрее execute_batch на порядок:
+    # нет накладных расходов Parse/Bind/Execute на каждую строку
+    use_copy = True
+    copy_binary_sql = f"COPY {table_name} (value) FROM STDIN WITH (FORMAT binary)"
+    copy_text_sql = f"COPY {table_name} (value) FROM STDIN WITH (FORMAT text)"
+
+    # Одна байтовая арена на все батчи: ядро пишет записи бинарного COPY
+    # подряд, без промежуточных Python-строк, списков кортежей,
+    # кодирования и экранирования. На запись уходит 6 байт заголовка + байты значения.
+    arena = None
+    if NUMBA_AVAILABLE:
+        arena = bytearray(batch_size * (max_length + 6))
+        arena_view = np.frombuffer(arena, dtype=np.uint8)
+
     while total_inserted < RECORDS_COUNT:
-        batch = []
         batch_count = min(batch_size, RECORDS_COUNT - total_inserted)
-        
-        for _ in range(batch_count):
-            value = generate_random_string(min_length, max_length)
-            batch.append((value,))
-        
-        execute_batch(
-            cur,
-            f"INSERT INTO {table_name} (value) VALUES (%s)",
-            batch,
-            page_size=batch_size
-        )
-        
+
+        if use_copy and FASTFILL_AVAILABLE:
+            # Cython-расширение собирает весь payload бинарного COPY одним C-циклом
+            payload = fastfill.fill_copy_batch(
+                batch_count, min_length, max_length,
+                _R.getrandbits(32), ALPHABET.encode('ascii')
+            )
+            try:
+                cur.copy_expert(copy_binary_sql, io.BytesIO(payload))
+            except psycopg2.Error as e:
+                conn.rollback()
+                use_copy = False
+                logger.warning(f"  COPY недоступен ({e}), переходим на execute_values.")
+        elif use_copy and arena is not None:
+            used = _fill_copy_arena(arena_view, ALPHABET_BYTES, min_length, max_length, batch_count)
+            buf = io.BytesIO()
+            buf.write(COPY_BINARY_HEADER)
+            buf.write(memoryview(arena)[:used])
+            buf.write(COPY_BINARY_TRAILER)
+            buf.seek(0)
+            try:
+                cur.copy_expert(copy_binary_sql, buf)
+            except psycopg2.Error as e:
+                conn.rollback()
+                use_copy = False
+                logger.warning(f"  COPY недоступен ({e}), переходим на execute_values.")
+        elif use_copy:
+            # Алфавит не содержит спецсимволов COPY, экранирование не нужно
+            buf = io.StringIO()
+            for value in generate_batch(batch_count, min_length, max_length):
+                buf.write(value)
+                buf.write('\n')
+            buf.seek(0)
+            try:
+                cur.copy_expert(copy_text_sql, buf)
+            except psycopg2.Error as e:
+                conn.rollback()
+                use_copy = False
+                logger.warning(f"  COPY недоступен ({e}), переходим на execute_values.")
+
+        if not use_copy:
+            # Один многострочный INSERT ... VALUES (...),(...) на весь батч
+            # вместо серии отдельных INSERT, как делал execute_batch
+            execute_values(
+                cur,
+                f"INSERT INTO {table_name} (value) VALUES %s",
+                [(value,) for value in generate_batch(batch_count, min_length, max_length)],
+                page_size=batch_size
+            )
+
         conn.commit()
         total_inserted += batch_count
         
@@ -185,6 +412,31 @@ def fill_table(conn, table_name, min_length, max_length, batch_size=BATCH_SIZE,
     return elapsed
 
 
+def _fill_one(args):
+    """Заполняет одну таблицу в отдельном процессе со своим подключением."""
+    table_name, min_length, max_length, skip_if_exists = args
+
+    # У каждого процесса свое зерно, чтобы таблицы не получили одинаковые данные
+    seed = os.getpid()
+    _R.seed(seed)
+    global _rng
+    _rng = np.random.default_rng(seed)
+    if NUMBA_AVAILABLE:
+        _seed_kernel(seed)
+
+    worker_logger = logging.getLogger(__name__)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        elapsed = fill_table(
+            conn, table_name, min_length, max_length,
+            logger=worker_logger,
+            skip_if_exists=skip_if_exists
+        )
+    finally:
+        conn.close()
+    return table_name, elapsed
+
+
 def main():
     """Основная функция."""
     # Парсинг аргументов командной строки
@@ -241,17 +493,25 @@ def main():
             (7, 'table7', 500, 1000),
         ]
         
+        tables_to_fill = []
         for table_num, table_name, min_len, max_len in tables_config:
             if table_num < start_from:
                 logger.info(f"Пропускаем таблицу {table_name} (до начальной таблицы table{start_from})")
                 continue
-            
-            results[table_name] = fill_table(
-                conn, table_name, min_len, max_len, 
-                logger=logger, 
-                skip_if_exists=args.skip_existing
-            )
-        
+            tables_to_fill.append((table_name, min_len, max_len, args.skip_existing))
+
+        # Таблицы независимы, поэтому заполняем их параллельно:
+        # по одному процессу и подключению на таблицу
+        max_workers = min(len(tables_to_fill), os.cpu_count() or 1)
+        logger.info(f"Параллельное заполнение: {max_workers} процессов\n")
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for table_name, elapsed in executor.map(_fill_one, tables_to_fill):
+                results[table_name] = elapsed
+
+        # Строим индексы уже по загруженным данным
+        build_indexes(conn, logger)
+
         conn.close()
         
         # Итоговая статистика
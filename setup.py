@@ -0,0 +1,16 @@
+"""
+Сборка опционального Cython-расширения fastfill:
+
+    pip install cython
+    python setup.py build_ext --inplace
+
+Без расширения fill_data.py использует Numba-ядро.
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name='fastfill',
+    ext_modules=cythonize('fastfill.pyx'),
+)
